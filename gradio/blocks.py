@@ -212,7 +212,7 @@ class Block:
         )
         if api_name is not None:
             api_name_ = utils.append_unique_suffix(
-                api_name, [dep["api_name"] for dep in Context.root_block.dependencies]
+                api_name, {dep["api_name"] for dep in Context.root_block.dependencies}
             )
             if not (api_name == api_name_):
                 warnings.warn(
@@ -738,7 +738,7 @@ class Blocks(BlockContext):
                 if api_name is not None:
                     api_name_ = utils.append_unique_suffix(
                         api_name,
-                        [dep["api_name"] for dep in Context.root_block.dependencies],
+                        {dep["api_name"] for dep in Context.root_block.dependencies},
                     )
                     if not (api_name == api_name_):
                         warnings.warn(
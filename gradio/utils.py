@@ -3,7 +3,8 @@
 from __future__ import annotations
 
 import asyncio
-import copy
+import atexit
+import functools
 import inspect
 import json
 import json.decoder
@@ -14,9 +15,11 @@ import re
 import subprocess
 import sys
 import tempfile
+import threading
 import time
 import typing
 import warnings
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
 from distutils.version import StrictVersion
 from enum import Enum
@@ -29,21 +32,23 @@ from typing import (
     Callable,
     Dict,
     Generator,
+    Iterable,
     List,
     NewType,
+    Set,
     Tuple,
     Type,
     TypeVar,
 )
 
-import aiohttp
 import fsspec.asyn
 import httpx
-import matplotlib
-import matplotlib.pyplot as plt
 import numpy as np
+import orjson
 import PIL
-import requests
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.backends.backend_svg import FigureCanvasSVG
+from matplotlib.figure import Figure
 from pydantic import BaseModel, Json, parse_obj_as
 
 import gradio
@@ -59,6 +64,19 @@ analytics_url = "https://api.gradio.app/"
 PKG_VERSION_URL = "https://api.gradio.app/pkg-version"
 JSON_PATH = os.path.join(os.path.dirname(gradio.__file__), "launches.json")
 
+# Shared client so that repeated calls to the same host reuse pooled connections
+_HTTP = httpx.Client(
+    limits=httpx.Limits(max_keepalive_connections=10, max_connections=20),
+    timeout=3.0,
+    follow_redirects=True,
+)
+atexit.register(_HTTP.close)
+# Analytics are sent in the background so that they never block launching the app
+_ANALYTICS_POOL = ThreadPoolExecutor(max_workers=1)
+# The async client can only be used from the event loop it was created on, so it is
+# stored together with that loop
+_ASYNC_HTTP: Tuple[asyncio.AbstractEventLoop, httpx.AsyncClient] | None = None
+
 T = TypeVar("T")
 
 
@@ -67,9 +85,7 @@ def version_check():
         current_pkg_version = (
             pkgutil.get_data(__name__, "version.txt").decode("ascii").strip()
         )
-        latest_pkg_version = requests.get(url=PKG_VERSION_URL, timeout=3).json()[
-            "version"
-        ]
+        latest_pkg_version = _HTTP.get(PKG_VERSION_URL).json()["version"]
         if StrictVersion(latest_pkg_version) > StrictVersion(current_pkg_version):
             print(
                 "IMPORTANT: You are using gradio version {}, "
@@ -90,39 +106,35 @@ def version_check():
 def get_local_ip_address() -> str:
     """Gets the public IP address or returns the string "No internet connection" if unable to obtain it."""
     try:
-        ip_address = requests.get(
-            "https://checkip.amazonaws.com/", timeout=3
-        ).text.strip()
-    except (requests.ConnectionError, requests.exceptions.ReadTimeout):
+        ip_address = _HTTP.get("https://checkip.amazonaws.com/").text.strip()
+    except httpx.TransportError:
         ip_address = "No internet connection"
     return ip_address
 
 
-def initiated_analytics(data: Dict[str:Any]) -> None:
+def _do_analytics_request(url: str, data: Dict[str, Any]) -> None:
     try:
-        requests.post(
-            analytics_url + "gradio-initiated-analytics/", data=data, timeout=3
-        )
-    except (requests.ConnectionError, requests.exceptions.ReadTimeout):
+        _HTTP.post(url, data=data)
+    except httpx.TransportError:
         pass  # do not push analytics if no network
 
 
+def initiated_analytics(data: Dict[str:Any]) -> None:
+    _ANALYTICS_POOL.submit(
+        _do_analytics_request, analytics_url + "gradio-initiated-analytics/", data
+    )
+
+
 def launch_analytics(data: Dict[str, Any]) -> None:
-    try:
-        requests.post(
-            analytics_url + "gradio-launched-analytics/", data=data, timeout=3
-        )
-    except (requests.ConnectionError, requests.exceptions.ReadTimeout):
-        pass  # do not push analytics if no network
+    _ANALYTICS_POOL.submit(
+        _do_analytics_request, analytics_url + "gradio-launched-analytics/", data
+    )
 
 
 def integration_analytics(data: Dict[str, Any]) -> None:
-    try:
-        requests.post(
-            analytics_url + "gradio-integration-analytics/", data=data, timeout=3
-        )
-    except (requests.ConnectionError, requests.exceptions.ReadTimeout):
-        pass  # do not push analytics if no network
+    _ANALYTICS_POOL.submit(
+        _do_analytics_request, analytics_url + "gradio-integration-analytics/", data
+    )
 
 
 def error_analytics(ip_address: str, message: str) -> None:
@@ -131,22 +143,36 @@ def error_analytics(ip_address: str, message: str) -> None:
     :param type: RuntimeError or NameError
     """
     data = {"ip_address": ip_address, "error": message}
-    try:
-        requests.post(analytics_url + "gradio-error-analytics/", data=data, timeout=3)
-    except (requests.ConnectionError, requests.exceptions.ReadTimeout):
-        pass  # do not push analytics if no network
+    _ANALYTICS_POOL.submit(
+        _do_analytics_request, analytics_url + "gradio-error-analytics/", data
+    )
+
+
+def _get_async_http() -> httpx.AsyncClient:
+    """Returns the async client for the running event loop, creating a new one if the loop has changed."""
+    global _ASYNC_HTTP
+    loop = asyncio.get_running_loop()
+    if _ASYNC_HTTP is None or _ASYNC_HTTP[0] is not loop:
+        # A client from a previous loop cannot be closed once that loop has closed, so
+        # it is simply dropped
+        _ASYNC_HTTP = (
+            loop,
+            httpx.AsyncClient(
+                limits=httpx.Limits(max_keepalive_connections=10, max_connections=20),
+                timeout=3.0,
+            ),
+        )
+    return _ASYNC_HTTP[1]
 
 
 async def log_feature_analytics(ip_address: str, feature: str) -> None:
     data = {"ip_address": ip_address, "feature": feature}
-    async with aiohttp.ClientSession() as session:
-        try:
-            async with session.post(
-                analytics_url + "gradio-feature-analytics/", data=data
-            ):
-                pass
-        except (aiohttp.ClientError):
-            pass  # do not push analytics if no network
+    try:
+        await _get_async_http().post(
+            analytics_url + "gradio-feature-analytics/", data=data
+        )
+    except httpx.HTTPError:
+        pass  # do not push analytics if no network
 
 
 def colab_check() -> bool:
@@ -184,10 +210,10 @@ def ipython_check() -> bool:
 
 def readme_to_html(article: str) -> str:
     try:
-        response = requests.get(article, timeout=3)
-        if response.status_code == requests.codes.ok:  # pylint: disable=no-member
+        response = _HTTP.get(article)
+        if response.status_code == httpx.codes.OK:
             article = response.text
-    except requests.exceptions.RequestException:
+    except (httpx.HTTPError, httpx.InvalidURL):
         pass
     return article
 
@@ -200,24 +226,41 @@ def show_tip(interface: gradio.Blocks) -> None:
 
 def launch_counter() -> None:
     try:
-        if not os.path.exists(JSON_PATH):
-            launches = {"launches": 1}
-            with open(JSON_PATH, "w+") as j:
-                json.dump(launches, j)
-        else:
-            with open(JSON_PATH) as j:
-                launches = json.load(j)
+        # "a+" creates the file if needed, so it is read and rewritten with a single open
+        with open(JSON_PATH, "a+b") as j:
+            j.seek(0)
+            contents = j.read()
+            launches = orjson.loads(contents) if contents else {"launches": 0}
             launches["launches"] += 1
             if launches["launches"] in [25, 50, 150, 500, 1000]:
                 print(gradio.strings.en["BETA_INVITE"])
-            with open(JSON_PATH, "w") as j:
-                j.write(json.dumps(launches))
+            j.truncate(0)
+            j.write(orjson.dumps(launches))
     except:
         pass
 
 
+@functools.lru_cache(maxsize=1024)
+def _cached_signature(fn: Callable) -> inspect.Signature:
+    return inspect.signature(fn)
+
+
+def get_signature(fn: Callable) -> inspect.Signature:
+    """Same as inspect.signature(), but caches the result for hashable callables."""
+    try:
+        return _cached_signature(fn)
+    except TypeError:  # unhashable callable
+        return inspect.signature(fn)
+
+
+@functools.lru_cache(maxsize=1024)
+def get_type_hints(fn: Callable) -> Dict[str, Any]:
+    """Same as typing.get_type_hints(), but caches the result. `fn` must be a function."""
+    return typing.get_type_hints(fn)
+
+
 def get_default_args(func: Callable) -> List[Any]:
-    signature = inspect.signature(func)
+    signature = get_signature(func)
     return [
         v.default if v.default is not inspect.Parameter.empty else None
         for v in signature.parameters.values()
@@ -236,9 +279,6 @@ def assert_configs_are_equivalent_besides_ids(
         the root level of the config. By default, only "mode" and "theme" are tested,
         so keys like "version" are ignored.
     """
-    config1 = copy.deepcopy(config1)
-    config2 = copy.deepcopy(config2)
-
     for key in root_keys:
         assert config1[key] == config2[key], f"Configs have different: {key}"
 
@@ -246,13 +286,12 @@ def assert_configs_are_equivalent_besides_ids(
         config2["components"]
     ), "# of components are different"
 
+    components1 = {c["id"]: c for c in config1["components"]}
+    components2 = {c["id"]: c for c in config2["components"]}
+
     def assert_same_components(config1_id, config2_id):
-        c1 = list(filter(lambda c: c["id"] == config1_id, config1["components"]))[0]
-        c2 = list(filter(lambda c: c["id"] == config2_id, config2["components"]))[0]
-        c1 = copy.deepcopy(c1)
-        c1.pop("id")
-        c2 = copy.deepcopy(c2)
-        c2.pop("id")
+        c1 = {k: v for k, v in components1[config1_id].items() if k != "id"}
+        c2 = {k: v for k, v in components2[config2_id].items() if k != "id"}
         assert c1 == c2, f"{c1} does not match {c2}"
 
     def same_children_recursive(children1, chidren2):
@@ -265,23 +304,20 @@ def assert_configs_are_equivalent_besides_ids(
     children2 = config2["layout"]["children"]
     same_children_recursive(children1, children2)
 
+    component_keys = ("targets", "inputs", "outputs")
     for d1, d2 in zip(config1["dependencies"], config2["dependencies"]):
-        for t1, t2 in zip(d1.pop("targets"), d2.pop("targets")):
-            assert_same_components(t1, t2)
-        for i1, i2 in zip(d1.pop("inputs"), d2.pop("inputs")):
-            assert_same_components(i1, i2)
-        for o1, o2 in zip(d1.pop("outputs"), d2.pop("outputs")):
-            assert_same_components(o1, o2)
+        for key in component_keys:
+            for c1, c2 in zip(d1[key], d2[key]):
+                assert_same_components(c1, c2)
 
+        d1 = {k: v for k, v in d1.items() if k not in component_keys}
+        d2 = {k: v for k, v in d2.items() if k not in component_keys}
         assert d1 == d2, f"{d1} does not match {d2}"
 
     return True
 
 
 def format_ner_list(input_string: str, ner_groups: Dict[str : str | int]):
-    if len(ner_groups) == 0:
-        return [(input_string, None)]
-
     output = []
     prev_end = 0
 
@@ -291,7 +327,7 @@ def format_ner_list(input_string: str, ner_groups: Dict[str : str | int]):
         output.append((input_string[start:end], entity))
         prev_end = end
 
-    output.append((input_string[end:], None))
+    output.append((input_string[prev_end:], None))
     return output
 
 
@@ -301,16 +337,26 @@ def delete_none(_dict: T, skip_value: bool = False) -> T:
     Credit: https://stackoverflow.com/a/66127889/5209347
     """
     if isinstance(_dict, dict):
-        for key, value in list(_dict.items()):
+        keys_to_delete = []
+        for key, value in _dict.items():
             if skip_value and key == "value":
                 continue
             if isinstance(value, (list, dict, tuple, set)):
                 _dict[key] = delete_none(value)
             elif value is None or key is None:
-                del _dict[key]
+                keys_to_delete.append(key)
+        for key in keys_to_delete:
+            del _dict[key]
 
     elif isinstance(_dict, (list, set, tuple)):
-        _dict = type(_dict)(delete_none(item) for item in _dict if item is not None)
+        if any(item is None or isinstance(item, (list, set, tuple)) for item in _dict):
+            _dict = type(_dict)(delete_none(item) for item in _dict if item is not None)
+        else:
+            # Nothing to remove at this level and dicts are cleaned in place,
+            # so the container itself does not need to be rebuilt
+            for item in _dict:
+                if isinstance(item, dict):
+                    delete_none(item)
 
     return _dict
 
@@ -322,6 +368,10 @@ def resolve_singleton(_list: List[Any] | Any) -> Any:
         return _list
 
 
+# Lower-case class name -> class, built by the first component_or_layout_class() call
+_COMPONENT_OR_LAYOUT_CLASSES: Dict[str, type] | None = None
+
+
 def component_or_layout_class(cls_name: str) -> Type[Component] | Type[BlockContext]:
     """
     Returns the component, template, or layout class with the given class name, or
@@ -332,32 +382,25 @@ def component_or_layout_class(cls_name: str) -> Type[Component] | Type[BlockCont
     Returns:
     cls: the component class
     """
-    import gradio.components
-    import gradio.layouts
-    import gradio.templates
-
-    components = [
-        (name, cls)
-        for name, cls in gradio.components.__dict__.items()
-        if isinstance(cls, type)
-    ]
-    templates = [
-        (name, cls)
-        for name, cls in gradio.templates.__dict__.items()
-        if isinstance(cls, type)
-    ]
-    layouts = [
-        (name, cls)
-        for name, cls in gradio.layouts.__dict__.items()
-        if isinstance(cls, type)
-    ]
-    for name, cls in components + templates + layouts:
-        if name.lower() == cls_name.replace("_", "") and (
-            issubclass(cls, gradio.components.Component)
-            or issubclass(cls, gradio.blocks.BlockContext)
-        ):
-            return cls
-    raise ValueError(f"No such component or layout: {cls_name}")
+    global _COMPONENT_OR_LAYOUT_CLASSES
+    if _COMPONENT_OR_LAYOUT_CLASSES is None:
+        import gradio.components
+        import gradio.layouts
+        import gradio.templates
+
+        classes = {}
+        for module in (gradio.components, gradio.templates, gradio.layouts):
+            for name, cls in module.__dict__.items():
+                if isinstance(cls, type) and issubclass(
+                    cls, (gradio.components.Component, gradio.blocks.BlockContext)
+                ):
+                    classes.setdefault(name.lower(), cls)
+        _COMPONENT_OR_LAYOUT_CLASSES = classes
+
+    try:
+        return _COMPONENT_OR_LAYOUT_CLASSES[cls_name.replace("_", "")]
+    except KeyError:
+        raise ValueError(f"No such component or layout: {cls_name}")
 
 
 def synchronize_async(func: Callable, *args, **kwargs) -> Any:
@@ -434,7 +477,11 @@ class AsyncRequest:
     """
 
     ResponseJson = NewType("ResponseJson", Json)
-    client = httpx.AsyncClient()
+    # Predictions can run for arbitrarily long, so only the connect phase is timed out
+    client = httpx.AsyncClient(
+        limits=httpx.Limits(max_keepalive_connections=100, max_connections=1000),
+        timeout=httpx.Timeout(None, connect=5.0),
+    )
 
     class Method(str, Enum):
         """
@@ -644,16 +691,19 @@ def set_directory(path: Path | str):
         os.chdir(origin)
 
 
+# Anything other than alphanumeric characters (including unicode ones) and ._-
+_INVALID_FILENAME_CHARACTERS = re.compile(r"[^\w.\- ]")
+# Matches values that spreadsheet software could interpret as a formula
+_UNSAFE_CSV_PATTERN = re.compile(r"^[=+\-@\t\n]|,[=+\-@\t\n]")
+
+
 def strip_invalid_filename_characters(filename: str, max_bytes: int = 200) -> str:
     """Strips invalid characters from a filename and ensures that the file_length is less than `max_bytes` bytes."""
-    filename = "".join([char for char in filename if char.isalnum() or char in "._- "])
-    filename_len = len(filename.encode())
-    if filename_len > max_bytes:
-        while filename_len > max_bytes:
-            if len(filename) == 0:
-                break
-            filename = filename[:-1]
-            filename_len = len(filename.encode())
+    filename = _INVALID_FILENAME_CHARACTERS.sub("", filename)
+    encoded_filename = filename.encode()
+    if len(encoded_filename) > max_bytes:
+        # Any multi-byte character cut in half by the truncation is dropped on decoding
+        filename = encoded_filename[:max_bytes].decode(errors="ignore")
     return filename
 
 
@@ -664,11 +714,7 @@ def sanitize_value_for_csv(value: str | Number) -> str | Number:
     """
     if isinstance(value, Number):
         return value
-    unsafe_prefixes = ["=", "+", "-", "@", "\t", "\n"]
-    unsafe_sequences = [",=", ",+", ",-", ",@", ",\t", ",\n"]
-    if any(value.startswith(prefix) for prefix in unsafe_prefixes) or any(
-        sequence in value for sequence in unsafe_sequences
-    ):
+    if _UNSAFE_CSV_PATTERN.search(value):
         value = "'" + value
     return value
 
@@ -689,9 +735,10 @@ def sanitize_list_for_csv(values: T) -> T:
     return sanitized_values
 
 
-def append_unique_suffix(name: str, list_of_names: List[str]):
+def append_unique_suffix(name: str, list_of_names: List[str] | Set[str]):
     """Appends a numerical suffix to `name` so that it does not appear in `list_of_names`."""
-    list_of_names = set(list_of_names)  # for O(1) lookup
+    if not isinstance(list_of_names, (set, frozenset)):
+        list_of_names = set(list_of_names)  # for O(1) lookup
     if name not in list_of_names:
         return name
     else:
@@ -703,34 +750,75 @@ def append_unique_suffix(name: str, list_of_names: List[str]):
         return new_name
 
 
+_VALID_URLS: Set[str] = set()
+# Media hosts can be slow to respond, so validation waits longer than the default
+_URL_VALIDATION_TIMEOUT = httpx.Timeout(30.0, connect=10.0)
+
+
 def validate_url(possible_url: str) -> bool:
-    headers = {"User-Agent": "gradio (https://gradio.app/; team@gradio.app)"}
+    if possible_url in _VALID_URLS:
+        return True
     try:
-        return requests.get(possible_url, headers=headers).ok
+        is_valid = _validate_url(possible_url)
     except Exception:
         return False
+    # Only valid URLs are remembered, since an error may be temporary
+    if is_valid:
+        if len(_VALID_URLS) >= 2048:
+            _VALID_URLS.clear()
+        _VALID_URLS.add(possible_url)
+    return is_valid
+
+
+def _validate_url(possible_url: str) -> bool:
+    headers = {"User-Agent": "gradio (https://gradio.app/; team@gradio.app)"}
+    response = _HTTP.head(
+        possible_url, headers=headers, timeout=_URL_VALIDATION_TIMEOUT
+    )
+    if not response.is_error:
+        return True
+    if response.status_code not in (405, 501):
+        return False
+    # The server does not support HEAD requests, so retry with a GET request without
+    # downloading the body
+    with _HTTP.stream(
+        "GET", possible_url, headers=headers, timeout=_URL_VALIDATION_TIMEOUT
+    ) as response:
+        return not response.is_error
 
 
 def is_update(val):
-    return isinstance(val, dict) and "update" in val.get("__type__", "")
+    return isinstance(val, dict) and val.get("__type__") in ("update", "generic_update")
 
 
 def get_continuous_fn(fn: Callable, every: float) -> Callable:
     def continuous_fn(*args):
+        # Sleep until the next tick rather than for a fixed `every`, so that the time
+        # spent in `fn` does not make the period drift
+        next_tick = time.monotonic()
         while True:
             output = fn(*args)
             yield output
-            time.sleep(every)
+            next_tick += every
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_tick = time.monotonic()
 
     return continuous_fn
 
 
+# Tasks named by set_task_name() that have not finished yet, keyed by name
+_NAMED_TASKS: Dict[str, Set[asyncio.Task]] = {}
+
+
 async def cancel_tasks(task_ids: List[str]):
     if sys.version_info < (3, 8):
         return None
 
     matching_tasks = [
-        task for task in asyncio.all_tasks() if task.get_name() in task_ids
+        task for task_id in task_ids for task in _NAMED_TASKS.get(task_id, ())
     ]
     for task in matching_tasks:
         task.cancel()
@@ -741,17 +829,32 @@ def set_task_name(task, session_hash: str, fn_index: int, batch: bool):
     if sys.version_info >= (3, 8) and not (
         batch
     ):  # You shouldn't be able to cancel a task if it's part of a batch
-        task.set_name(f"{session_hash}_{fn_index}")
+        name = f"{session_hash}_{fn_index}"
+        task.set_name(name)
+        _NAMED_TASKS.setdefault(name, set()).add(task)
+        task.add_done_callback(_forget_named_task)
+
+
+def _forget_named_task(task: asyncio.Task):
+    name = task.get_name()
+    tasks = _NAMED_TASKS.get(name)
+    if tasks is not None:
+        tasks.discard(task)
+        if not tasks:
+            del _NAMED_TASKS[name]
 
 
 def get_cancel_function(
     dependencies: List[Dict[str, Any]]
 ) -> Tuple[Callable, List[int]]:
     fn_to_comp = {}
+    dep_indices = {id(d): i for i, d in enumerate(Context.root_block.dependencies)}
     for dep in dependencies:
-        fn_index = next(
-            i for i, d in enumerate(Context.root_block.dependencies) if d == dep
-        )
+        fn_index = dep_indices.get(id(dep))
+        if fn_index is None:  # not the registered object, so fall back to equality
+            fn_index = next(
+                i for i, d in enumerate(Context.root_block.dependencies) if d == dep
+            )
         fn_to_comp[fn_index] = [Context.root_block.blocks[o] for o in dep["outputs"]]
 
     async def cancel(session_hash: str) -> None:
@@ -776,8 +879,8 @@ def check_function_inputs_match(fn: Callable, inputs: List, inputs_as_dict: bool
         """Checks if parameter has a type hint designating it as a gr.Request"""
         return parameter_types.get(name, "") == Request
 
-    signature = inspect.signature(fn)
-    parameter_types = typing.get_type_hints(fn) if inspect.isfunction(fn) else {}
+    signature = get_signature(fn)
+    parameter_types = get_type_hints(fn) if inspect.isfunction(fn) else {}
     min_args = 0
     max_args = 0
     for name, param in signature.parameters.items():
@@ -818,6 +921,19 @@ class TupleNoPrint(tuple):
 
 set_documentation_group("component-helpers")
 
+# A single figure is reused (and drawn directly on an Agg canvas, bypassing pyplot)
+# for every waveform. The lock guards it since events may run in parallel threads.
+_WAVEFORM_FIG = Figure(figsize=(10, 2), dpi=100)
+_WAVEFORM_AX = _WAVEFORM_FIG.add_subplot(111)
+# Let the axes fill the whole figure, so that no bbox_inches="tight" pass is needed
+_WAVEFORM_FIG.subplots_adjust(left=0, bottom=0, right=1, top=1)
+FigureCanvasAgg(_WAVEFORM_FIG)
+_WAVEFORM_LOCK = threading.Lock()
+# The intermediate waveform image is written to a RAM-backed directory when available
+_RAM_TMP_DIR = (
+    "/dev/shm" if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK) else None
+)
+
 
 @document()
 def make_waveform(
@@ -829,6 +945,7 @@ def make_waveform(
     bars_color: str | Tuple[str, str] = ("#fbbf24", "#ea580c"),
     bar_count: int = 50,
     bar_width: float = 0.6,
+    ffmpeg_encoder: str | None = None,
 ):
     """
     Generates a waveform video from an audio file. Useful for creating an easy to share audio visualization. The output should be passed into a `gr.Video` component.
@@ -840,6 +957,7 @@ def make_waveform(
         bars_color: Color of waveform bars. Can be a single color or a tuple of (start_color, end_color) of gradient
         bar_count: Number of bars in waveform
         bar_width: Width of bars in waveform. 1 represents full width, 0.5 represents half width, etc.
+        ffmpeg_encoder: Name of the ffmpeg video encoder to use, e.g. "h264_nvenc", "h264_qsv" or "h264_videotoolbox" to encode on the GPU. If None, or if the encoder is not available or fails, libx264 is used with settings tuned for still images ("-tune stillimage -preset veryfast"), or ffmpeg's default encoder if libx264 is not available.
     Returns:
         A filepath to the output video.
     """
@@ -860,105 +978,260 @@ def make_waveform(
         assert n > 1
         c1_rgb = np.array(hex_to_RGB(c1)) / 255
         c2_rgb = np.array(hex_to_RGB(c2)) / 255
-        mix_pcts = [x / (n - 1) for x in range(n)]
-        rgb_colors = [((1 - mix) * c1_rgb + (mix * c2_rgb)) for mix in mix_pcts]
-        return [
-            "#" + "".join([format(int(round(val * 255)), "02x") for val in item])
-            for item in rgb_colors
-        ]
+        mix_pcts = (np.arange(n) / (n - 1))[:, None]
+        rgb_colors = (1 - mix_pcts) * c1_rgb + mix_pcts * c2_rgb
+        rgb_colors = np.clip(np.round(rgb_colors * 255), 0, 255).astype(np.uint8)
+        return ["#" + color.tobytes().hex() for color in rgb_colors]
 
     # Reshape audio to have a fixed number of bars
     samples = audio[1]
     if len(samples.shape) > 1:
         samples = np.mean(samples, 1)
-    bins_to_pad = bar_count - (len(samples) % bar_count)
-    samples = np.pad(samples, [(0, bins_to_pad)])
-    samples = np.reshape(samples, (bar_count, -1))
-    samples = np.abs(samples)
-    samples = np.max(samples, 1)
-
-    matplotlib.use("Agg")
-    plt.clf()
+    bins_to_pad = -len(samples) % bar_count
+    # Write the absolute values straight into the zero-padded buffer to avoid
+    # allocating an intermediate copy of the (possibly long) audio for each step.
+    # Empty audio still gets one (zero) sample per bar.
+    padded_samples = np.zeros(
+        max(len(samples) + bins_to_pad, bar_count), dtype=samples.dtype
+    )
+    np.abs(samples, out=padded_samples[: len(samples)])
+    samples = padded_samples.reshape(bar_count, -1).max(axis=1)
+
     # Plot waveform
     color = (
         bars_color
         if isinstance(bars_color, str)
         else get_color_gradient(bars_color[0], bars_color[1], bar_count)
     )
-    plt.bar(
-        np.arange(0, bar_count),
-        samples * 2,
-        bottom=(-1 * samples),
-        width=bar_width,
-        color=color,
-    )
-    plt.axis("off")
-    plt.margins(x=0)
-    tmp_img = tempfile.NamedTemporaryFile(suffix=".png", delete=False)
-    savefig_kwargs = {"bbox_inches": "tight"}
+    # The images are only read back once (by PIL, then ffmpeg), so favor encoding
+    # speed over file size
+    savefig_kwargs = {"pil_kwargs": {"compress_level": 1}}
     if bg_image is not None:
         savefig_kwargs["transparent"] = True
     else:
         savefig_kwargs["facecolor"] = bg_color
-    plt.savefig(tmp_img.name, **savefig_kwargs)
-    waveform_img = PIL.Image.open(tmp_img.name)
-    waveform_img = waveform_img.resize((1000, 200))
+    with _WAVEFORM_LOCK:
+        _WAVEFORM_AX.cla()
+        _WAVEFORM_AX.bar(
+            np.arange(0, bar_count),
+            samples * 2,
+            bottom=(-1 * samples),
+            width=bar_width,
+            color=color,
+        )
+        _WAVEFORM_AX.axis("off")
+        # Leave a small padding around the bars, like the "tight" bbox used to
+        _WAVEFORM_AX.set_xlim(-1, bar_count)
+        y_lim = 1.1 * samples.max() or 1
+        _WAVEFORM_AX.set_ylim(-y_lim, y_lim)
+        # Render in memory; only the final image is written to disk for ffmpeg
+        waveform_buffer = BytesIO()
+        # dpi and bbox_inches are given explicitly so that the user's savefig rc params
+        # cannot change the size of the 1000x200 image the figure is laid out for (None
+        # would fall back to rcParams["savefig.bbox"], so the full figure box is passed)
+        _WAVEFORM_FIG.savefig(
+            waveform_buffer,
+            format="png",
+            dpi=100,
+            bbox_inches=_WAVEFORM_FIG.bbox_inches,
+            **savefig_kwargs,
+        )
+    waveform_buffer.seek(0)
+    # The figure is sized to render at 1000x200 already, so no resize is needed
+    waveform_img = PIL.Image.open(waveform_buffer)
+
+    tmp_img = tempfile.NamedTemporaryFile(suffix=".png", dir=_RAM_TMP_DIR, delete=False)
 
     # Composite waveform with background image
     if bg_image is not None:
-        waveform_array = np.array(waveform_img)
-        waveform_array[:, :, 3] = waveform_array[:, :, 3] * fg_alpha
-        waveform_img = PIL.Image.fromarray(waveform_array)
+        # point() builds a 256-entry lookup table, so the scaling is done by PIL in C
+        # rather than through a float copy of the alpha channel
+        alpha = waveform_img.getchannel("A").point(lambda a: int(a * fg_alpha))
+        waveform_img.putalpha(alpha)
 
         bg_img = PIL.Image.open(bg_image)
         waveform_width, waveform_height = waveform_img.size
         bg_width, bg_height = bg_img.size
         if waveform_width != bg_width:
-            bg_img = bg_img.resize(
-                (waveform_width, 2 * int(bg_height * waveform_width / bg_width / 2))
+            bg_size = (
+                waveform_width,
+                2 * int(bg_height * waveform_width / bg_width / 2),
             )
+            try:
+                import cv2
+            except (ImportError, ModuleNotFoundError):
+                cv2 = None
+            # The background can be arbitrarily large, so use OpenCV's vectorized
+            # resize when it is installed (area averaging when shrinking)
+            if cv2 is not None and bg_img.mode in ("L", "RGB", "RGBA"):
+                interpolation = (
+                    cv2.INTER_AREA if bg_width > waveform_width else cv2.INTER_LINEAR
+                )
+                bg_img = PIL.Image.fromarray(
+                    cv2.resize(np.asarray(bg_img), bg_size, interpolation=interpolation)
+                )
+            else:
+                bg_img = bg_img.resize(bg_size, PIL.Image.BILINEAR)
             bg_width, bg_height = bg_img.size
         composite_height = max(bg_height, waveform_height)
-        composite = PIL.Image.new("RGBA", (waveform_width, composite_height), "#FFFFFF")
-        composite.paste(bg_img, (0, composite_height - bg_height))
-        composite.paste(
-            waveform_img, (0, composite_height - waveform_height), waveform_img
-        )
-        composite.save(tmp_img.name)
+        if bg_height < composite_height:
+            composite = PIL.Image.new(
+                "RGBA", (waveform_width, composite_height), "#FFFFFF"
+            )
+            composite.paste(bg_img, (0, composite_height - bg_height))
+        else:
+            composite = bg_img.convert("RGBA")
+        # A single C pass blends the waveform over the background in place
+        composite.alpha_composite(waveform_img, (0, composite_height - waveform_height))
+        composite.save(tmp_img.name, compress_level=1)
         img_width, img_height = composite.size
     else:
         img_width, img_height = waveform_img.size
-        waveform_img.save(tmp_img.name)
+        waveform_img.save(tmp_img.name, compress_level=1)
 
     # Convert waveform to video with ffmpeg
     output_mp4 = tempfile.NamedTemporaryFile(suffix=".mp4", delete=False)
 
-    ffmpeg_cmd = f"""ffmpeg -loop 1 -i {tmp_img.name} -i {audio_file} -vf "color=c=#FFFFFF77:s={img_width}x{img_height}[bar];[0][bar]overlay=-w+(w/{duration})*t:H-h:shortest=1" -t {duration} -y {output_mp4.name}"""
+    def ffmpeg_cmd(encoder_args):
+        # Passed as a list rather than through a shell, so paths need no quoting
+        return [
+            "ffmpeg",
+            "-loglevel",
+            "error",
+            "-nostats",
+            "-loop",
+            "1",
+            # The video is a still image with a moving bar, so a low frame rate is
+            # enough. It is set on the input, so that the overlay is only computed for
+            # the frames that are kept (an output -r would drop frames after overlaying
+            # and put the bar out of sync with the audio)
+            "-framerate",
+            "10",
+            "-i",
+            tmp_img.name,
+            "-i",
+            audio_file,
+            "-vf",
+            # yuv420p (which most players require) needs even dimensions
+            f"color=c=#FFFFFF77:s={img_width}x{img_height}[bar];[0][bar]overlay=-w+(w/{duration})*t:H-h:shortest=1,crop=trunc(iw/2)*2:trunc(ih/2)*2",
+            *encoder_args,
+            # faststart lets browsers begin playback before the download ends
+            "-pix_fmt",
+            "yuv420p",
+            "-movflags",
+            "+faststart",
+            "-threads",
+            str(os.cpu_count() or 0),
+            "-t",
+            str(duration),
+            "-y",
+            output_mp4.name,
+        ]
 
-    subprocess.call(ffmpeg_cmd, shell=True)
-    return output_mp4.name
+    if ffmpeg_encoder is not None and ffmpeg_encoder not in _ffmpeg_video_encoders():
+        warnings.warn(
+            f"ffmpeg encoder {ffmpeg_encoder} is not available, using the default encoder instead."
+        )
+        ffmpeg_encoder = None
+    try:
+        if ffmpeg_encoder is not None:
+            # Hardware encoders can be compiled in but still fail, e.g. without a GPU
+            encoder_cmd = ffmpeg_cmd(["-c:v", ffmpeg_encoder])
+            if subprocess.run(encoder_cmd, stdin=subprocess.DEVNULL).returncode == 0:
+                return output_mp4.name
+            warnings.warn(
+                f"ffmpeg encoder {ffmpeg_encoder} failed, using the default encoder instead."
+            )
+        default_encoder_args = []
+        if "libx264" in _ffmpeg_video_encoders():
+            # These options are specific to libx264, which is tuned here for still images
+            default_encoder_args = [
+                "-c:v",
+                "libx264",
+                "-tune",
+                "stillimage",
+                "-preset",
+                "veryfast",
+            ]
+        subprocess.run(
+            ffmpeg_cmd(default_encoder_args), check=True, stdin=subprocess.DEVNULL
+        )
+        return output_mp4.name
+    finally:
+        tmp_img.close()
+        os.remove(tmp_img.name)
+
+
+@functools.lru_cache(maxsize=None)
+def _ffmpeg_video_encoders() -> Set[str]:
+    """Returns the names of the video encoders supported by the installed ffmpeg."""
+    try:
+        output = subprocess.run(
+            ["ffmpeg", "-hide_banner", "-encoders"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return set()
+    encoders = set()
+    for line in output.splitlines():
+        # Lines look like " V....D libx264    libx264 H.264 / AVC / MPEG-4 AVC ..."
+        fields = line.split()
+        if len(fields) >= 2 and fields[0].startswith("V") and fields[1] != "=":
+            encoders.add(fields[1])
+    return encoders
+
+
+# As with the waveforms, a single figure is reused for every formula. It is drawn
+# straight onto an SVG canvas, with a transparent background set once here
+_TEX_FIG = Figure(figsize=(0.01, 0.01), facecolor="none", edgecolor="none")
+_TEX_CANVAS = FigureCanvasSVG(_TEX_FIG)
+# Re-entrant, so that tex2svg_many() can hold it across a whole batch of formulas
+_TEX_LOCK = threading.RLock()
 
 
 def tex2svg(formula, *args):
+    # The extra arguments passed by the markdown renderer are not used (and are not
+    # hashable), so only the formula is used to look up the cache
+    return _tex2svg(formula)
+
+
+def tex2svg_many(formulas: Iterable[str]) -> List[str]:
+    """
+    Renders several formulas in one pass on the shared figure, without releasing it
+    to other threads in between. Returns one SVG string per formula, in order.
+    """
+    with _TEX_LOCK:
+        return [_tex2svg(formula) for formula in formulas]
+
+
+@functools.lru_cache(maxsize=1024)
+def _tex2svg(formula: str) -> str:
     FONTSIZE = 20
     DPI = 300
-    plt.rc("mathtext", fontset="cm")
-    fig = plt.figure(figsize=(0.01, 0.01))
-    fig.text(0, 0, r"${}$".format(formula), fontsize=FONTSIZE)
     output = BytesIO()
-    fig.savefig(
-        output,
-        dpi=DPI,
-        transparent=True,
-        format="svg",
-        bbox_inches="tight",
-        pad_inches=0.0,
-    )
-    plt.close(fig)
-    output.seek(0)
-    xml_code = output.read().decode("utf-8")
-    svg_start = xml_code.index("<svg ")
-    svg_code = xml_code[svg_start:]
-    svg_code = re.sub(r"<metadata>.*<\/metadata>", "", svg_code, flags=re.DOTALL)
+    with _TEX_LOCK:
+        _TEX_FIG.clf()
+        # The math font is set on the text itself rather than through the global rc
+        # params, so the formulas do not change the user's own plots
+        _TEX_FIG.text(
+            0, 0, r"${}$".format(formula), fontsize=FONTSIZE, math_fontfamily="cm"
+        )
+        _TEX_CANVAS.print_figure(
+            output, dpi=DPI, format="svg", bbox_inches="tight", pad_inches=0.0
+        )
+    # Slice the SVG as bytes and decode only the part that is kept
+    xml_code = output.getvalue()
+    svg_start = xml_code.index(b"<svg ")
+    metadata_start = xml_code.find(b"<metadata>", svg_start)
+    metadata_end = xml_code.rfind(b"</metadata>")
+    if metadata_start != -1 and metadata_end != -1:
+        svg_code = (
+            xml_code[svg_start:metadata_start]
+            + xml_code[metadata_end + len(b"</metadata>") :]
+        ).decode("utf-8")
+    else:
+        svg_code = xml_code[svg_start:].decode("utf-8")
     copy_code = f"<span style='font-size: 0px'>{formula}</span>"
     return f"{copy_code}{svg_code}"
@@ -256,10 +256,11 @@ class TestBlocksMethods:
         demo.share_url = None
         demo.close()
 
-    @mock.patch("requests.post")
+    @mock.patch("gradio.utils._HTTP.post")
     def test_initiated_analytics(self, mock_post):
         with gr.Blocks(analytics_enabled=True):
             pass
+        gr.utils._ANALYTICS_POOL.submit(lambda: None).result()
         mock_post.assert_called_once()
 
     def test_show_error(self):
@@ -888,7 +889,7 @@ class TestCancel:
 
         cancel_fun = demo.fns[-1].fn
         task = asyncio.create_task(long_job())
-        task.set_name("foo_0")
+        gr.utils.set_task_name(task, "foo", 0, batch=False)
         # If cancel_fun didn't cancel long_job the message would be printed to the console
         # The test would also take 10 seconds
         await asyncio.gather(task, cancel_fun("foo"), return_exceptions=True)
@@ -924,7 +925,7 @@ class TestCancel:
         cancel_fun = demo.fns[-1].fn
 
         task = asyncio.create_task(long_job())
-        task.set_name("foo_1")
+        gr.utils.set_task_name(task, "foo", 1, batch=False)
         await asyncio.gather(task, cancel_fun("foo"), return_exceptions=True)
         captured = capsys.readouterr()
         assert "HELLO FROM LONG JOB" not in captured.out
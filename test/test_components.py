@@ -9,6 +9,7 @@ import json
 import os
 import pathlib
 import shutil
+import subprocess
 import tempfile
 from copy import deepcopy
 from difflib import SequenceMatcher
@@ -1215,6 +1216,42 @@ class TestVideo:
         iface = gr.Interface(lambda x: gr.make_waveform(x), "audio", "video")
         assert iface(x_audio).endswith(".mp4")
 
+    def test_waveform_with_unavailable_encoder(self):
+        x_audio = media_data.BASE64_AUDIO["name"]
+        with pytest.warns(UserWarning, match="is not available"):
+            output = gr.make_waveform(x_audio, ffmpeg_encoder="not_an_encoder")
+        assert output.endswith(".mp4")
+
+    def test_waveform_with_empty_audio(self):
+        output = gr.make_waveform((8000, np.zeros(0, dtype=np.int16)))
+        assert output.endswith(".mp4")
+
+    def test_waveform_progress_bar_tracks_audio(self):
+        # One second of silence on a black background, so only the bar is visible
+        output = gr.make_waveform(
+            (8000, np.zeros(8000, dtype=np.int16)), bg_color="#000000"
+        )
+        raw_frames = subprocess.run(
+            ["ffmpeg", "-loglevel", "error", "-i", output]
+            + ["-f", "rawvideo", "-pix_fmt", "gray", "-"],
+            capture_output=True,
+            check=True,
+        ).stdout
+        frames = np.frombuffer(raw_frames, dtype=np.uint8).reshape(-1, 200, 1000)
+        bar_widths = [int((frame[100] > 40).sum()) for frame in frames]
+        # At 10 fps, the bar advances by a tenth of the width every frame
+        assert len(bar_widths) == 10
+        for i, width in enumerate(bar_widths):
+            assert abs(width - 100 * i) <= 4
+
+    def test_waveform_size_ignores_savefig_rc_params(self):
+        x_audio = media_data.BASE64_AUDIO["name"]
+        with matplotlib.rc_context({"savefig.dpi": 200, "savefig.bbox": "tight"}):
+            with patch("subprocess.run", wraps=subprocess.run) as run:
+                gr.make_waveform(x_audio)
+        ffmpeg_args = run.call_args.args[0]
+        assert "s=1000x200" in ffmpeg_args[ffmpeg_args.index("-vf") + 1]
+
     def test_video_postprocess_converts_to_playable_format(self):
         test_file_dir = pathlib.Path(pathlib.Path(__file__).parent, "test_files")
         # This file has a playable container but not playable codec
@@ -190,12 +190,13 @@ class TestInterface:
             interface.integrate(wandb=wandb)
             wandb.log.assert_called_once()
 
-    @mock.patch("requests.post")
+    @mock.patch("gradio.utils._HTTP.post")
     def test_integration_analytics(self, mock_post):
         mlflow.log_param = mock.MagicMock()
         interface = Interface(lambda x: x, "textbox", "label")
         interface.analytics_enabled = True
         interface.integrate(mlflow=mlflow)
+        gradio.utils._ANALYTICS_POOL.submit(lambda: None).result()
         mock_post.assert_called_once()
 
 
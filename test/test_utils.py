@@ -1,3 +1,4 @@
+import asyncio
 import copy
 import ipaddress
 import json
@@ -5,9 +6,9 @@ import os
 import unittest.mock as mock
 import warnings
 
+import httpx
 import pytest
 import pytest_asyncio
-import requests
 from httpx import AsyncClient, Response
 from pydantic import BaseModel
 from typing_extensions import Literal
@@ -18,7 +19,9 @@ from gradio.test_data.blocks_configs import (
     XRAY_CONFIG_WITH_MISTAKE,
 )
 from gradio.utils import (
+    _ANALYTICS_POOL,
     AsyncRequest,
+    _get_async_http,
     append_unique_suffix,
     assert_configs_are_equivalent_besides_ids,
     colab_check,
@@ -32,6 +35,8 @@ from gradio.utils import (
     sanitize_list_for_csv,
     sanitize_value_for_csv,
     strip_invalid_filename_characters,
+    tex2svg,
+    tex2svg_many,
     validate_url,
     version_check,
 )
@@ -39,8 +44,13 @@ from gradio.utils import (
 os.environ["GRADIO_ANALYTICS_ENABLED"] = "False"
 
 
+def wait_for_analytics():
+    # Analytics are sent from a single background worker, so this waits for the queue
+    _ANALYTICS_POOL.submit(lambda: None).result()
+
+
 class TestUtils:
-    @mock.patch("requests.get")
+    @mock.patch("gradio.utils._HTTP.get")
     def test_should_warn_with_unable_to_parse(self, mock_get):
         mock_get.side_effect = json.decoder.JSONDecodeError("Expecting value", "", 0)
 
@@ -52,7 +62,7 @@ class TestUtils:
                 == "unable to parse version details from package URL."
             )
 
-    @mock.patch("requests.Response.json")
+    @mock.patch("httpx.Response.json")
     def test_should_warn_url_not_having_version(self, mock_json):
         mock_json.return_value = {"foo": "bar"}
 
@@ -61,23 +71,32 @@ class TestUtils:
             version_check()
             assert str(w[-1].message) == "package URL does not contain version info."
 
-    @mock.patch("requests.post")
+    @mock.patch("gradio.utils._HTTP.post")
     def test_error_analytics_doesnt_crash_on_connection_error(self, mock_post):
-        mock_post.side_effect = requests.ConnectionError()
+        mock_post.side_effect = httpx.ConnectError("")
         error_analytics("placeholder", "placeholder")
+        wait_for_analytics()
         mock_post.assert_called()
 
-    @mock.patch("requests.post")
+    @mock.patch("gradio.utils._HTTP.post")
     def test_error_analytics_successful(self, mock_post):
         error_analytics("placeholder", "placeholder")
+        wait_for_analytics()
         mock_post.assert_called()
 
-    @mock.patch("requests.post")
+    @mock.patch("gradio.utils._HTTP.post")
     def test_launch_analytics_doesnt_crash_on_connection_error(self, mock_post):
-        mock_post.side_effect = requests.ConnectionError()
+        mock_post.side_effect = httpx.ConnectError("")
         launch_analytics(data={})
+        wait_for_analytics()
         mock_post.assert_called()
 
+    def test_async_analytics_client_is_recreated_for_each_event_loop(self):
+        async def get_client():
+            return _get_async_http()
+
+        assert asyncio.run(get_client()) is not asyncio.run(get_client())
+
     @mock.patch("IPython.get_ipython")
     def test_colab_check_no_ipython(self, mock_get_ipython):
         mock_get_ipython.return_value = None
@@ -93,9 +112,9 @@ class TestUtils:
         mock_get_ipython.return_value = None
         assert ipython_check() is False
 
-    @mock.patch("requests.get")
+    @mock.patch("gradio.utils._HTTP.get")
     def test_readme_to_html_doesnt_crash_on_connection_error(self, mock_get):
-        mock_get.side_effect = requests.ConnectionError()
+        mock_get.side_effect = httpx.ConnectError("")
         readme_to_html("placeholder")
 
     def test_readme_to_html_correct_parse(self):
@@ -110,9 +129,9 @@ class TestIPAddress:
             return
         ipaddress.ip_address(ip)
 
-    @mock.patch("requests.get")
+    @mock.patch("gradio.utils._HTTP.get")
     def test_get_ip_without_internet(self, mock_get):
-        mock_get.side_effect = requests.ConnectionError()
+        mock_get.side_effect = httpx.ConnectError("")
         ip = get_local_ip_address()
         assert ip == "No internet connection"
 
@@ -126,6 +145,13 @@ class TestAssertConfigsEquivalent:
             XRAY_CONFIG, XRAY_CONFIG_DIFF_IDS
         )
 
+    def test_configs_are_not_modified(self):
+        config1 = copy.deepcopy(XRAY_CONFIG)
+        config2 = copy.deepcopy(XRAY_CONFIG_DIFF_IDS)
+        assert_configs_are_equivalent_besides_ids(config1, config2)
+        assert config1 == XRAY_CONFIG
+        assert config2 == XRAY_CONFIG_DIFF_IDS
+
     def test_different_configs(self):
         with pytest.raises(AssertionError):
             assert_configs_are_equivalent_besides_ids(
@@ -229,6 +255,11 @@ class TestFormatNERList:
         result = [("I live in a city", None)]
         assert format_ner_list(string, groups) == result
 
+    def test_format_ner_list_empty_iterator(self):
+        string = "I live in a city"
+        result = [("I live in a city", None)]
+        assert format_ner_list(string, iter([])) == result
+
 
 class TestDeleteNone:
     """Credit: https://stackoverflow.com/questions/33797126/proper-way-to-remove-keys-in-dictionary-with-none-values-in-python"""
@@ -248,6 +279,11 @@ class TestDeleteNone:
         truth = {"a": 12, "b": 34, "k": {"d": 34, "m": [{"k": 23}, [1, 2, 3], {1, 2}]}}
         assert delete_none(input) == truth
 
+    def test_delete_none_keeps_containers_without_none(self):
+        input = [{"k": 23, "t": None}, {"a": 1}]
+        assert delete_none(input) is input
+        assert input == [{"k": 23}, {"a": 1}]
+
 
 @pytest_asyncio.fixture(scope="function", autouse=True)
 async def client():
@@ -502,6 +538,26 @@ class TestValidateURL:
         assert not (validate_url("C:\\Users\\"))
         assert not (validate_url("/home/user"))
 
+    def test_unavailable_url_is_checked_again(self, respx_mock):
+        url = "https://recovering.example.com/image.png"
+        respx_mock.head(url).mock(
+            side_effect=[httpx.Response(503), httpx.Response(200)]
+        )
+        assert not validate_url(url)
+        assert validate_url(url)
+
+    def test_get_is_only_tried_when_head_is_not_allowed(self, respx_mock):
+        url = "https://no-head.example.com/image.png"
+        respx_mock.head(url).mock(return_value=httpx.Response(405))
+        respx_mock.get(url).mock(return_value=httpx.Response(200))
+        assert validate_url(url)
+
+        missing_url = "https://missing.example.com/image.png"
+        respx_mock.head(missing_url).mock(return_value=httpx.Response(404))
+        get_route = respx_mock.get(missing_url).mock(return_value=httpx.Response(200))
+        assert not validate_url(missing_url)
+        assert not get_route.called
+
 
 class TestAppendUniqueSuffix:
     def test_no_suffix(self):
@@ -520,6 +576,20 @@ class TestAppendUniqueSuffix:
         assert append_unique_suffix(name, list_of_names) == "test_4"
 
 
+class TestTex2Svg:
+    def test_tex2svg(self):
+        svg = tex2svg("x^2", {"display_mode": False})
+        assert svg.startswith("<span style='font-size: 0px'>x^2</span><svg ")
+        assert "<metadata>" not in svg
+
+    def test_repeated_formula_is_cached(self):
+        assert tex2svg("\\frac{a}{b}") is tex2svg("\\frac{a}{b}", {})
+
+    def test_tex2svg_many(self):
+        formulas = ["x^2", "\\sqrt{y}", "x^2"]
+        assert tex2svg_many(formulas) == [tex2svg(formula) for formula in formulas]
+
+
 @pytest.mark.parametrize(
     "orig_filename, new_filename",
     [